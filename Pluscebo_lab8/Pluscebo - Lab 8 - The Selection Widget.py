@@ -3,6 +3,30 @@ from tkinter import ttk
 from tkinter import messagebox
 from tkinter.messagebox import showinfo
 
+class LazyCombobox(ttk.Combobox):
+    """Combobox that asks a data source for its values instead of holding them all."""
+    def __init__(self, master, source, page_size=50, debounce_ms=200, **kwargs):
+        super().__init__(master, postcommand=self.load_values, **kwargs)
+        self.source = source  # Called as source(prefix, limit), returns a list of option strings
+        self.page_size = page_size  # Only this many options are held at a time
+        self.debounce_ms = debounce_ms
+        self.pending = None  # Id of the scheduled filter, if any
+        self.bind("<KeyRelease>", self.schedule_filter, add="+")
+
+    def load_values(self):
+        # Called right before the dropdown opens, so values always match the typed text
+        self['values'] = self.source(self.get().strip(), self.page_size)
+
+    def schedule_filter(self, event):
+        # Wait until typing pauses before asking the source again
+        if self.pending is not None:
+            self.after_cancel(self.pending)
+        self.pending = self.after(self.debounce_ms, self.apply_filter)
+
+    def apply_filter(self):
+        self.pending = None
+        self.load_values()
+
 # Creating tkinter window and set dimensions
 window = tk.Tk()
 window.title('Combobox')
@@ -21,12 +45,8 @@ ttk.Label(window, text="Choose your birth month",
 ttk.Label(window, text="Select the month of your birth :",
     font=("Times New Roman", 12)).grid(column=0, row=5, padx=5, pady=25)
 
-# Create Combobox
-n = tk.StringVar()
-month = ttk.Combobox(window, width=27, textvariable=n)
-
-# Adding combobox drop down list
-month['values'] = (' January',
+# Data source for the combobox drop down list
+months = (' January',
         ' February',
         ' March',
         ' April',
@@ -38,6 +58,14 @@ month['values'] = (' January',
         ' October',
         ' November',
         ' December')
+
+def month_source(prefix, limit):
+    matches = [m for m in months if m.strip().lower().startswith(prefix.lower())]
+    return matches[:limit]
+
+# Create Combobox
+n = tk.StringVar()
+month = LazyCombobox(window, month_source, width=27, textvariable=n)
 month.grid(column=1, row=5)
 month.current()
 
@@ -0,0 +1,53 @@
+"""Benchmark rebuilding the stock at a past time from one year of history."""
+import os
+import sys
+import random
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from final_labmaterials import InventoryHistory
+
+MATERIALS = 500  # Distinct materials in the inventory
+CHANGES_PER_DAY = 200  # Borrowings and admin edits per day
+DAYS = 365
+QUERIES = 200
+TARGET_MS = 20.0  # Slowest allowed average time to rebuild one past state
+
+
+def build_year(directory, seed=0):
+    """Write one year of synthetic changes and return the start and end timestamps."""
+    rng = random.Random(seed)
+    history = InventoryHistory(directory)
+    materials = {f"Material {i}": rng.randint(1, 100) for i in range(MATERIALS)}
+    start = time.time() - DAYS * 86400
+    history.snapshot(materials, start)
+    step = 86400 / CHANGES_PER_DAY
+    for i in range(DAYS * CHANGES_PER_DAY):
+        name = f"Material {rng.randrange(MATERIALS)}"
+        materials[name] = max(0, materials[name] + rng.randint(-5, 5))
+        history.record({name: materials[name]}, materials, start + (i + 1) * step)
+    return history, start, start + DAYS * 86400
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        began = time.perf_counter()
+        history, start, end = build_year(directory)
+        build_seconds = time.perf_counter() - began
+
+        rng = random.Random(1)
+        began = time.perf_counter()
+        for _ in range(QUERIES):
+            history.state_at(rng.uniform(start, end))
+        average_ms = (time.perf_counter() - began) / QUERIES * 1000
+
+        print(f"Changes written: {DAYS * CHANGES_PER_DAY} in {build_seconds:.2f} s")
+        print(f"Snapshots: {len(history.snapshots)}")
+        print(f"Average rebuild: {average_ms:.2f} ms (target {TARGET_MS:.0f} ms)")
+        return 0 if average_ms <= TARGET_MS else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
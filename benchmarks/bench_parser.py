@@ -0,0 +1,65 @@
+"""Benchmark the database.txt parser in lines per second."""
+import os
+import sys
+import random
+import argparse
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from final_labmaterials import DatabaseManager
+
+
+def generate_database(filename, lines, seed=0):
+    """Write a database file with some quoted names, blank lines and broken lines mixed in."""
+    rng = random.Random(seed)
+    with open(filename, 'w') as file:
+        for i in range(lines):
+            roll = rng.random()
+            if roll < 0.05:
+                file.write(f'"Material {i}, large",{rng.randint(1, 100)}\n')
+            elif roll < 0.051:
+                file.write("\n")
+            elif roll < 0.052:
+                file.write(f"Material {i}\n")  # Missing quantity
+            else:
+                file.write(f"Material {i},{rng.randint(1, 100)}\n")
+
+
+def split_loader(filename):
+    """The original line.strip().split(',') loader, minus the bad lines it would crash on."""
+    materials = {}
+    with open(filename, 'r') as file:
+        for line in file:
+            parts = line.strip().split(',')
+            if len(parts) == 2:
+                materials[parts[0]] = int(parts[1])
+    return materials
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=1000000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'database.txt')
+        generate_database(filename, args.lines)
+        runs = [
+            ('split baseline', lambda: split_loader(filename)),
+            ('read_records', lambda: DatabaseManager(filename).materials),
+            ('read_records mmap', lambda: DatabaseManager(filename, use_mmap=True).materials),
+        ]
+        for label, load in runs:
+            start = time.perf_counter()
+            load()
+            seconds = time.perf_counter() - start
+            print(f"{label:18} {args.lines / seconds:12,.0f} lines/sec ({seconds:.2f} s)")
+        skipped = len(DatabaseManager(filename).load_errors)
+        print(f"Bad lines skipped and reported: {skipped}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
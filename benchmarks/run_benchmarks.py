@@ -0,0 +1,216 @@
+"""Headless benchmarks for the borrowing system, compared against a stored baseline.
+
+Timings depend on the machine, so the stored baseline is only meaningful on the
+machine that recorded it. Re-record it with --update-baseline on each machine
+before using the regression check there.
+"""
+import os
+import sys
+import csv
+import json
+import random
+import platform
+import argparse
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')  # No display needed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5 import QtWidgets
+
+import final_labmaterials as app_module
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCALES = {
+    # materials, accounts, log rows
+    'small': (100, 100, 1000),
+    'medium': (5000, 10000, 50000),
+    'large': (50000, 100000, 500000),
+}
+
+
+def generate_data(directory, materials, accounts, log_rows, seed=0):
+    """Write synthetic accounts.txt, database.txt and log.csv into a directory."""
+    rng = random.Random(seed)
+    with open(os.path.join(directory, 'accounts.txt'), 'w') as file:
+        for i in range(accounts):
+            file.write(f"Student {i},{2020000000 + i}\n")
+    with open(os.path.join(directory, 'database.txt'), 'w') as file:
+        for i in range(materials):
+            file.write(f"Material {i:06d},{rng.randint(1000, 5000)}\n")
+    with open(os.path.join(directory, 'log.csv'), 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Borrower', 'Student Number', 'Date', 'Materials'])
+        for i in range(log_rows):
+            student = rng.randrange(max(accounts, 1))
+            borrowed = "; ".join(f"Material {rng.randrange(materials):06d}:{rng.randint(1, 5)}"
+                                 for _ in range(rng.randint(1, 4)))
+            writer.writerow([f"Student {student}", 2020000000 + student, "2024-01-01 08:00", borrowed])
+
+
+def measure(function, repeat, setup=None):
+    """Run function repeat times and return the timings in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def run(materials, accounts, repeat, seed):
+    """Drive the app headlessly in the current directory and return the timings by benchmark."""
+    rng = random.Random(seed)
+    results = {}
+    account_manager = app_module.AccountManager()
+    last = accounts - 1
+
+    def drop_index():
+        account_manager.index_stamp = False  # As on the first login, read and index the whole file again
+
+    login = lambda: account_manager.login(f"Student {last}", str(2020000000 + last))
+    results['login_cold'] = measure(login, repeat, setup=drop_index)
+    results['login'] = measure(login, repeat)  # Index is current, only the file is checked for changes
+
+    windows = []  # Closed after timing so closing is not measured
+    results['startup_borrowing'] = measure(
+        lambda: windows.append(app_module.BorrowingApp("Student 0", "2020000000")), repeat)
+    results['startup_admin'] = measure(lambda: windows.append(app_module.AdminApp()), repeat)
+    for window in windows:
+        window.close()
+
+    borrowing = app_module.BorrowingApp("Student 0", "2020000000")
+    target = f"Material {materials // 2:06d}"
+
+    def select_target():
+        borrowing.clear_inputs()
+        borrowing.material_combo.setEditText(target)
+
+    results['add_material'] = measure(borrowing.add_material, repeat, setup=select_target)
+
+    def add_target():
+        select_target()
+        borrowing.add_material()
+
+    results['finish_borrowing'] = measure(borrowing.finish_borrowing, repeat, setup=add_target)
+
+    admin = app_module.AdminApp()
+
+    def fill_admin():
+        admin.material_name_input.setText(target)
+        admin.quantity_input.setValue(rng.randint(1, 100))
+
+    results['admin_update'] = measure(admin.add_update_material, repeat, setup=fill_admin)
+    borrowing.close()
+    admin.close()
+    return {name: {'median_ms': statistics.median(timings), 'min_ms': min(timings), 'runs': len(timings)}
+            for name, timings in results.items()}
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Return the benchmarks whose fastest run is slower than the baseline by more than the tolerance."""
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        # The fastest run is the least disturbed by disk flushes and scheduling, unlike the median.
+        # The slack grows with the baseline, plus a little for timer jitter on microsecond timings
+        limit = expected['min_ms'] * (1 + tolerance) + min_delta_ms
+        if result['min_ms'] > limit:
+            regressions.append(f"{name}: {result['min_ms']:.3f} ms > {limit:.3f} ms")
+    return regressions
+
+
+def keep_fastest(results, more):
+    """Keep the least disturbed run of each benchmark."""
+    for name, result in more.items():
+        if result['min_ms'] < results[name]['min_ms']:
+            results[name] = result
+
+
+def run_suite(scale, repeat, seed):
+    """Generate fresh data in a temporary directory and run every benchmark there."""
+    materials, accounts, log_rows = SCALES[scale]
+    previous_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        generate_data(directory, materials, accounts, log_rows, seed)
+        os.chdir(directory)  # The app reads and writes its files relative to the working directory
+        try:
+            return run(materials, accounts, repeat, seed)
+        finally:
+            os.chdir(previous_directory)
+
+
+def machine_description():
+    return f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPU, Python {platform.python_version()}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_results.json', help="Where to write the results")
+    parser.add_argument('--baseline', default=os.path.join(BENCH_DIR, 'baseline.json'))
+    parser.add_argument('--tolerance', type=float, default=0.5, help="Allowed slowdown, 0.5 means 50%%")
+    parser.add_argument('--min-delta', type=float, default=0.05,
+                        help="Slowdown in ms allowed on top of the tolerance, for timer jitter")
+    parser.add_argument('--retries', type=int, default=2,
+                        help="Times to run the suite again before reporting a regression")
+    parser.add_argument('--update-baseline', action='store_true', help="Store these results as the baseline")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output)
+    baseline_file = os.path.abspath(args.baseline)
+
+    qt_app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    # Dialogs would wait for a click, so answer them straight away
+    QtWidgets.QMessageBox.information = lambda *args, **kwargs: QtWidgets.QMessageBox.Ok
+    QtWidgets.QMessageBox.warning = lambda *args, **kwargs: QtWidgets.QMessageBox.Ok
+
+    results = run_suite(args.scale, args.repeat, args.seed)
+    report = {'scale': args.scale, 'repeat': args.repeat, 'python': sys.version.split()[0], 'results': results}
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    for name, result in results.items():
+        print(f"{name:20} median {result['median_ms']:9.3f} ms   min {result['min_ms']:9.3f} ms")
+
+    baselines = {}
+    if os.path.exists(baseline_file):
+        with open(baseline_file, 'r') as file:
+            baselines = json.load(file)
+    machine = machine_description()
+    if args.update_baseline:
+        for _ in range(args.retries):  # As many runs as a check may take, so both keep the same kind of minimum
+            keep_fastest(results, run_suite(args.scale, args.repeat, args.seed))
+        baselines[args.scale] = {'machine': machine, 'results': results}
+        with open(baseline_file, 'w') as file:
+            json.dump(baselines, file, indent=2)
+        print(f"Baseline for {args.scale} saved to {baseline_file}")
+        return 0
+    if args.scale not in baselines:
+        print(f"No baseline for {args.scale}, run with --update-baseline to store one")
+        return 0
+    baseline = baselines[args.scale]
+    if baseline['machine'] != machine:
+        print(f"Warning: baseline was recorded on {baseline['machine']}, re-record it on this machine")
+    regressions = compare(results, baseline['results'], args.tolerance, args.min_delta)
+    for attempt in range(args.retries):
+        if not regressions:
+            break
+        # A busy machine can slow a whole run down, so only report a slowdown that happens again
+        print(f"Possible regression, running the suite again ({attempt + 1}/{args.retries})")
+        keep_fastest(results, run_suite(args.scale, args.repeat, args.seed))
+        regressions = compare(results, baseline['results'], args.tolerance, args.min_delta)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,140 @@
+import os
 import sys
 import csv
+import gzip
+import json
+import mmap
+import multiprocessing
+import time
+import bisect
+import cProfile
+import uuid
+import hashlib
+import functools
+import contextlib
+import locale
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from PyQt5 import QtWidgets, QtGui, QtCore
 from datetime import datetime
 import pytz
+try:
+    import fcntl  # File locks on Linux and macOS
+except ImportError:
+    fcntl = None
+    import msvcrt  # File locks on Windows
 
 tz = pytz.timezone('Asia/Manila')
 current_time = datetime.now(tz).strftime("%Y-%m-%d %H:%M")
+ENCODING = 'utf-8'  # Every file the app writes uses this encoding
+LEGACY_ENCODING = locale.getpreferredencoding(False)  # Encoding of files written before ENCODING was set
+
+class Metrics:
+    """Class to collect latency histograms and call counts for the slow paths of the app."""
+    BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)  # Upper bounds in seconds
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled  # Timing is skipped entirely while disabled
+        self.stats = {}  # Operation name -> count, total seconds, slowest call and bucket counts
+        self.profiler = None  # cProfile.Profile while a capture is running
+
+    def observe(self, name, seconds):
+        """Add one timed call to the histogram of an operation."""
+        stat = self.stats.get(name)
+        if stat is None:
+            stat = self.stats[name] = {'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * len(self.BUCKETS)}
+        stat['count'] += 1
+        stat['sum'] += seconds
+        stat['max'] = max(stat['max'], seconds)
+        for i, bound in enumerate(self.BUCKETS):
+            if seconds <= bound:
+                stat['buckets'][i] += 1
+                break
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """Time the body of a with block."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """Decorator that times every call of a function."""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def percentile(self, name, fraction):
+        """Estimate a latency percentile as the upper bound of the bucket it falls in."""
+        stat = self.stats[name]
+        wanted = fraction * stat['count']
+        seen = 0
+        for bound, count in zip(self.BUCKETS, stat['buckets']):
+            seen += count
+            if seen >= wanted:
+                return bound
+        return stat['max']  # Slower than the largest bucket
+
+    def summary(self):
+        """Return one line per operation for display."""
+        lines = []
+        for name, stat in sorted(self.stats.items()):
+            average = stat['sum'] / stat['count'] * 1000
+            lines.append(f"{name}: {stat['count']} calls, avg {average:.3f} ms, "
+                         f"p95 <= {self.percentile(name, 0.95) * 1000:g} ms, max {stat['max'] * 1000:.3f} ms")
+        return "\n".join(lines)
+
+    def reset(self):
+        self.stats.clear()
+
+    def export_json(self, filename='metrics.json'):
+        """Write the collected metrics to a JSON file."""
+        with open(filename, 'w', encoding=ENCODING) as file:
+            json.dump({'buckets': self.BUCKETS, 'operations': self.stats}, file, indent=2)
+
+    def export_prometheus(self, filename='metrics.prom'):
+        """Write the collected metrics in the Prometheus text format."""
+        lines = ["# HELP labmaterials_latency_seconds Time spent in each operation.",
+                 "# TYPE labmaterials_latency_seconds histogram"]
+        for name, stat in sorted(self.stats.items()):
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS, stat['buckets']):
+                cumulative += count
+                lines.append(f'labmaterials_latency_seconds_bucket{{op="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'labmaterials_latency_seconds_bucket{{op="{name}",le="+Inf"}} {stat["count"]}')
+            lines.append(f'labmaterials_latency_seconds_sum{{op="{name}"}} {stat["sum"]}')
+            lines.append(f'labmaterials_latency_seconds_count{{op="{name}"}} {stat["count"]}')
+        with open(filename, 'w', encoding=ENCODING) as file:
+            file.write("\n".join(lines) + "\n")
+
+    def start_profile(self):
+        """Start capturing a cProfile of everything the app does."""
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop_profile(self, filename='profile.prof'):
+        """Stop the cProfile capture and save it for pstats or snakeviz."""
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(filename)
+            self.profiler = None
+
+metrics = Metrics(enabled=os.environ.get('LAB_METRICS') == '1')  # Shared by the whole app
 
 class Material:
     """Class to represent a laboratory material with a name and quantity."""
@@ -13,57 +142,435 @@ class Material:
         self.name = name
         self.quantity = quantity
 
+class RecentKeys:
+    """Class to remember the most recent keys, forgetting the oldest once full."""
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.keys = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def add(self, key):
+        self.keys[key] = None
+        self.keys.move_to_end(key)
+        if len(self.keys) > self.maxsize:
+            self.keys.popitem(last=False)  # Drop the oldest key
+
+committed_checkouts = RecentKeys()  # Keys of carts that were already checked out
+
+class BorrowingCart:
+    """Class to collect the materials of one borrowing session and check them out together."""
+    def __init__(self):
+        self.materials = []  # Line items, one Material per addition
+        self.key = uuid.uuid4().hex  # Idempotency key, the same for every submission of this cart
+
+    def add(self, name, quantity):
+        self.materials.append(Material(name, quantity))
+
+    def remove(self, name):
+        """Remove the first line item for a material."""
+        for material in self.materials:
+            if material.name == name:
+                self.materials.remove(material)
+                break
+
+    def reserved(self, name):
+        """Return how much of a material is already in the cart."""
+        return sum(material.quantity for material in self.materials if material.name == name)
+
+    def clear(self):
+        """Empty the cart and start a new checkout with a fresh key."""
+        self.materials.clear()
+        self.key = uuid.uuid4().hex
+
+    def commit(self, db_manager, log_file, student_name, student_number, current_time):
+        """Check out every line item at once, returning False if this cart was already checked out."""
+        if self.key in committed_checkouts:
+            return False  # Duplicate submission, e.g. a double click
+        materials_borrowed = "; ".join(f"{material.name}:{material.quantity}" for material in self.materials)
+        db_manager.checkout([(material.name, material.quantity) for material in self.materials], log_file,
+                            [student_name, student_number, current_time, materials_borrowed])
+        committed_checkouts.add(self.key)
+        return True
+
+def parse_lines(lines, fields, errors):
+    """Yield (line number, original line, row) for each well-formed line, adding the bad ones to errors."""
+    for number, original in enumerate(lines, 1):
+        original = original.rstrip('\r\n')
+        if not original.isascii():
+            try:
+                original.encode(ENCODING)
+            except UnicodeEncodeError:
+                # Bytes that do not decode were read as surrogates, try the encoding older versions wrote in
+                try:
+                    original = original.encode(ENCODING, 'surrogateescape').decode(LEGACY_ENCODING)
+                except UnicodeDecodeError:
+                    errors.append((number, original, f"not valid {ENCODING} text"))  # Written back unchanged
+                    continue
+        line = original.strip()  # Surrounding spaces are not part of the data
+        if not line:
+            continue  # Blank lines are harmless
+        if '"' in line:
+            try:
+                row = next(csv.reader([line]))  # Quoted name, may contain commas
+            except csv.Error as error:
+                errors.append((number, original, str(error)))
+                continue
+        else:
+            row = line.split(',')  # Fast path for the common unquoted line
+        if len(row) != fields:
+            errors.append((number, original, f"expected {fields} fields, found {len(row)}"))
+            continue
+        yield number, original, row
+
+def mapped_lines(mapped, chunk_size=1024 * 1024):
+    """Yield the lines of a memory-mapped file, decoding it a chunk at a time."""
+    start, size = 0, len(mapped)
+    while start < size:
+        end = mapped.find(b'\n', min(start + chunk_size, size) - 1)  # Cut chunks at a line end
+        end = size if end == -1 else end + 1
+        lines = mapped[start:end].decode(ENCODING, errors='surrogateescape').split('\n')
+        if lines[-1] == '':
+            lines.pop()  # Nothing after the final newline of the chunk
+        yield from lines
+        start = end
+
+def read_records(filename, fields, errors, use_mmap=False):
+    """Stream the rows of a comma-separated file, skipping and reporting bad lines."""
+    # surrogateescape lets parse_lines report a line that does not decode instead of failing the whole file
+    if not use_mmap:
+        with open(filename, 'r', encoding=ENCODING, errors='surrogateescape') as file:
+            yield from parse_lines(file, fields, errors)
+        return
+    with open(filename, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return  # An empty file cannot be mapped
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield from parse_lines(mapped_lines(mapped), fields, errors)
+
 class AccountManager:
     """Class to manage user accounts."""
     def __init__(self, filename='accounts.txt'):
         self.filename = filename
+        self.load_errors = []  # (line number, text, reason) for lines that could not be read
+        self.pairs = set()  # (name, student number) of every account
+        self.names = set()
+        self.numbers = set()
+        self.index_stamp = False  # Size and modification time of the file the index was built from
+
+    def accounts(self):
+        """Yield (name, student number) for every readable account line."""
+        self.load_errors = []
+        try:
+            for number, line, (existing_name, existing_number) in read_records(self.filename, 2, self.load_errors):
+                yield existing_name, existing_number
+        except FileNotFoundError:
+            pass  # No accounts registered yet
 
+    def file_stamp(self):
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def refresh_index(self):
+        """Rebuild the in-memory account index if the file changed since it was built."""
+        stamp = self.file_stamp()
+        if stamp == self.index_stamp:
+            return  # Index is current, no need to read the file
+        self.pairs, self.names, self.numbers = set(), set(), set()
+        for existing_name, existing_number in self.accounts():
+            self.pairs.add((existing_name, existing_number))
+            self.names.add(existing_name)
+            self.numbers.add(existing_number)
+        self.index_stamp = stamp
+
+    @metrics.timed('accounts_register')
     def register(self, name, student_number):
         """Register a new user if the name or student number does not already exist."""
-        with open(self.filename, 'a+') as file:
-            file.seek(0)
-            for line in file:
-                existing_name, existing_number = line.strip().split(',')
-                if existing_name == name or existing_number == student_number:
-                    return False  # User already exists
-            file.write(f"{name},{student_number}\n")  # Save new user
+        self.refresh_index()
+        if name in self.names or student_number in self.numbers:
+            return False  # User already exists
+        with open(self.filename, 'a', newline='', encoding=ENCODING) as file:
+            csv.writer(file, lineterminator='\n').writerow([name, student_number])  # Save new user, quoted if needed
+        self.pairs.add((name, student_number))
+        self.names.add(name)
+        self.numbers.add(student_number)
+        self.index_stamp = self.file_stamp()  # The index already holds the line just written
         return True  # Registration successful
 
+    @metrics.timed('accounts_login')
     def login(self, name, student_number):
         """Check if the provided credentials match an existing account."""
-        with open(self.filename, 'r') as file:
-            for line in file:
-                existing_name, existing_number = line.strip().split(',')
-                if existing_name == name and existing_number == student_number:
-                    return True  # Login successful
-        return False  # Credentials incorrect
+        self.refresh_index()
+        return (name, student_number) in self.pairs
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on a lock file, shared by every window and every copy of the app."""
+    with open(path, 'a+b') as file:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)  # Retries for about 10 seconds
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+class InventoryHistory:
+    """Class to keep snapshots and changes of the stock so past inventories can be rebuilt."""
+    def __init__(self, directory='history', snapshot_every=500):
+        self.directory = directory
+        self.snapshot_every = snapshot_every  # Most changes replayed on top of a snapshot
+        self.lock_file = os.path.join(directory, 'history.lock')
+        self.latest_file = os.path.join(directory, 'latest')  # Key of the newest snapshot
+        os.makedirs(directory, exist_ok=True)
+        self.snapshots = []
+        self.pending = 0  # Changes written since the latest snapshot
+        self.deltas_seen = None  # (snapshot key, deltas file size) that pending was counted for
+        with file_lock(self.lock_file):
+            self.refresh()
+
+    def snapshot_path(self, key):
+        return os.path.join(self.directory, f"snapshot-{key}.json.gz")
+
+    def deltas_path(self, key):
+        # Changes made after a snapshot are kept in a file named after it
+        return os.path.join(self.directory, f"deltas-{key}.csv")
+
+    def refresh(self):
+        """Pick up snapshots and changes written by other windows and copies of the app, under the lock."""
+        try:
+            with open(self.latest_file, 'r', encoding=ENCODING) as file:
+                latest = int(file.read())
+        except (FileNotFoundError, ValueError):
+            latest = None
+        if latest is None or not self.snapshots or latest != self.snapshots[-1]:
+            # Only list the folder when a snapshot was taken elsewhere, it grows by one file per snapshot
+            self.snapshots = sorted(int(filename[9:-8]) for filename in os.listdir(self.directory)
+                                    if filename.startswith('snapshot-') and filename.endswith('.json.gz'))
+            if self.snapshots and latest != self.snapshots[-1]:
+                self.write_latest(self.snapshots[-1])
+        if not self.snapshots:
+            self.pending = 0
+            return
+        try:
+            size = os.path.getsize(self.deltas_path(self.snapshots[-1]))
+        except FileNotFoundError:
+            size = 0
+        if (self.snapshots[-1], size) != self.deltas_seen:
+            self.pending = 0
+            if size:
+                with open(self.deltas_path(self.snapshots[-1]), 'rb') as file:
+                    self.pending = sum(1 for line in file)
+            self.deltas_seen = (self.snapshots[-1], size)
+
+    def snapshot(self, materials, timestamp=None):
+        """Write a compressed copy of the whole stock."""
+        with file_lock(self.lock_file):
+            self.refresh()
+            self.write_snapshot(materials, timestamp)
+
+    def write_snapshot(self, materials, timestamp):
+        key = int((time.time() if timestamp is None else timestamp) * 1000000)  # Microseconds
+        if self.snapshots and key <= self.snapshots[-1]:
+            key = self.snapshots[-1] + 1  # Keep keys unique and increasing
+        with gzip.open(self.snapshot_path(key), 'wt', compresslevel=6, encoding=ENCODING) as file:
+            json.dump(materials, file, separators=(',', ':'))
+        self.snapshots.append(key)
+        self.write_latest(key)
+        self.pending = 0
+        self.deltas_seen = (key, 0)
+
+    def write_latest(self, key):
+        with open(self.latest_file, 'w', encoding=ENCODING) as file:
+            file.write(str(key))
+
+    def record(self, changes, materials, timestamp=None):
+        """Append changed quantities, None meaning removed, and snapshot when enough have piled up."""
+        with file_lock(self.lock_file):
+            self.refresh()  # Another copy of the app may have taken a snapshot since the last record
+            if not self.snapshots:
+                return self.write_snapshot(materials, timestamp)  # First record, the snapshot already holds the changes
+            if not changes:
+                return
+            key = max(int((time.time() if timestamp is None else timestamp) * 1000000), self.snapshots[-1])
+            with open(self.deltas_path(self.snapshots[-1]), 'a', newline='', encoding=ENCODING) as file:
+                writer = csv.writer(file)
+                for name, quantity in changes.items():
+                    writer.writerow([key, name, '' if quantity is None else quantity])
+                size = file.tell()
+            self.pending += len(changes)
+            self.deltas_seen = (self.snapshots[-1], size)
+            if self.pending >= self.snapshot_every:
+                self.write_snapshot(materials, timestamp)
+
+    def state_at(self, when):
+        """Return the stock as it was at a datetime or epoch timestamp."""
+        if isinstance(when, datetime):
+            when = when.timestamp()
+        target = int(when * 1000000)
+        with file_lock(self.lock_file):  # A snapshot or change being written would be read half done
+            self.refresh()
+            position = bisect.bisect_right(self.snapshots, target) - 1  # Nearest snapshot at or before the target
+            if position < 0:
+                return {}  # Before any history was kept
+            key = self.snapshots[position]
+            with gzip.open(self.snapshot_path(key), 'rt', encoding=ENCODING) as file:
+                materials = json.load(file)
+            try:
+                with open(self.deltas_path(key), 'r', newline='', encoding=ENCODING) as file:
+                    for changed_at, name, quantity in csv.reader(file):
+                        if int(changed_at) > target:
+                            break  # Deltas are written in time order
+                        if quantity:
+                            materials[name] = int(quantity)
+                        else:
+                            materials.pop(name, None)
+            except FileNotFoundError:
+                pass
+        return materials
+
+def read_materials(filename, errors, use_mmap=False):
+    """Return the {name: quantity} stock in a database file, adding the lines that could not be read to errors."""
+    materials = {}
+    try:
+        for number, line, (name, quantity) in read_records(filename, 2, errors, use_mmap):
+            try:
+                materials[name] = int(quantity)
+            except ValueError:
+                errors.append((number, line, f"invalid quantity {quantity!r}"))
+    except FileNotFoundError:
+        pass  # If the file doesn't exist, return an empty dictionary
+    return materials
 
 class DatabaseManager:
     """Class to manage materials in the database."""
-    def __init__(self, filename='database.txt'):
+    def __init__(self, filename='database.txt', history=None, use_mmap=False):
         self.filename = filename
+        self.use_mmap = use_mmap  # Map the file into memory instead of reading it, for very large files
+        self.load_errors = []  # (line number, text, reason) for lines skipped while loading, kept on save
+        # New stock is written here, then renamed over the database. One per process, so copies of the app
+        # saving to the same lab never share a temporary file
+        self.temp_filename = f"{filename}.{os.getpid()}.tmp"
+        self.remove_stale_temp_files()
         self.materials = self.load_materials()
-
+        self.name_index = None  # Sorted (lowercase name, name) pairs, built on first search
+        self.history = history  # Optional InventoryHistory that receives every saved change
+        self.saved = dict(self.materials)  # Stock as last written, to work out what changed
+        if history is not None and not history.snapshots:
+            history.snapshot(self.materials)  # Starting point for replaying changes
+
+    def remove_stale_temp_files(self, max_age=3600):
+        """Remove temporary files left by saves that never reached their rename."""
+        directory, base = os.path.split(os.path.abspath(self.filename))
+        own = os.path.abspath(self.temp_filename)
+        for entry in os.scandir(directory):
+            if not (entry.name.startswith(base + '.') and entry.name.endswith('.tmp')):
+                continue
+            try:
+                # Another copy of the app may be saving right now, so only its old files count as abandoned
+                if entry.path == own or time.time() - entry.stat().st_mtime > max_age:
+                    os.remove(entry.path)  # The database file still holds the last full save
+            except FileNotFoundError:
+                pass  # Renamed or removed by its owner in the meantime
+
+    @metrics.timed('load_materials')
     def load_materials(self):
         """Load materials from the database file."""
-        materials = {}
-        try:
-            with open(self.filename, 'r') as file:
-                for line in file:
-                    name, quantity = line.strip().split(',')
-                    materials[name] = int(quantity)
-        except FileNotFoundError:
-            pass  # If the file doesn't exist, return an empty dictionary
-        return materials
-
+        self.load_errors = []
+        return read_materials(self.filename, self.load_errors, self.use_mmap)
+
+    def write_materials(self, materials):
+        """Write materials to the temporary file next to the database and flush it to disk."""
+        # Only the undecodable lines kept in load_errors hold surrogates, they are written back as the same bytes
+        with open(self.temp_filename, 'w', newline='', encoding=ENCODING, errors='surrogateescape') as file:
+            writer = csv.writer(file, lineterminator='\n')  # Quotes names that contain commas
+            writer.writerows(materials.items())
+            for number, line, reason in self.load_errors:
+                file.write(line + '\n')  # Lines that could not be read are kept as they were, not dropped
+            file.flush()
+            os.fsync(file.fileno())  # Contents must be on disk before the rename can expose them
+
+    def replace_database(self):
+        """Rename the temporary file over the database and flush the rename to disk."""
+        os.replace(self.temp_filename, self.filename)  # Atomic, never leaves a half-written file
+        self.sync_directory()
+
+    def sync_directory(self):
+        """Flush a rename in the database's folder to disk."""
+        if hasattr(os, 'O_DIRECTORY'):  # Windows cannot open a directory, there the rename is not synced
+            directory = os.open(os.path.dirname(os.path.abspath(self.filename)), os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+
+    def record_changes(self):
+        """Pass what changed since the last save on to the history."""
+        if self.history is not None:
+            changes = {name: quantity for name, quantity in self.materials.items()
+                       if self.saved.get(name) != quantity}
+            changes.update({name: None for name in self.saved if name not in self.materials})
+            self.history.record(changes, self.materials)
+        self.saved = dict(self.materials)
+
+    @metrics.timed('save_materials')
     def save_materials(self):
         """Save materials to the database file."""
-        with open(self.filename, 'w') as file:
-            for name, quantity in self.materials.items():
-                file.write(f"{name},{quantity}\n")
+        self.write_materials(self.materials)
+        self.replace_database()
+        self.record_changes()
+
+    @metrics.timed('checkout')
+    def checkout(self, items, log_file, log_row):
+        """Subtract borrowed (name, quantity) items, then log the borrowing and save the stock together."""
+        # New stock is kept apart until the files are written, so a failed checkout can be retried safely
+        materials = dict(self.materials)
+        for name, quantity in items:
+            if name in materials:
+                materials[name] = max(0, materials[name] - quantity)  # Prevent negative stock
+        with file_lock(log_file + '.lock'):  # Another copy of the app must not append while a row may be taken back
+            log_size = None  # Size of the log before this borrowing was appended
+            try:
+                self.write_materials(materials)  # New stock is on disk before the log changes
+                with open(log_file, 'a', newline='', encoding=ENCODING) as file:
+                    log_size = file.tell()
+                    log_writer = csv.writer(file)
+                    if log_size == 0:
+                        log_writer.writerow(['Borrower', 'Student Number', 'Date', 'Materials'])  # Write header
+                    log_writer.writerow(log_row)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(self.temp_filename, self.filename)  # The checkout is committed once this succeeds
+            except Exception:
+                # Nothing was committed: the database file is unchanged and the log is cut back to its old size,
+                # so a retry logs the borrowing once
+                if os.path.exists(self.temp_filename):
+                    os.remove(self.temp_filename)
+                if log_size is not None:
+                    with open(log_file, 'r+b') as file:
+                        file.truncate(log_size)
+                        os.fsync(file.fileno())
+                raise
+        # Stock file and log are both synced. Only a crash between the log write and the rename
+        # can leave the borrowing logged without its stock change
+        self.materials = materials
+        self.sync_directory()
+        self.record_changes()
 
     def add_material(self, name, quantity):
         """Add a new material or update the quantity."""
+        if name not in self.materials:
+            self.name_index = None  # New name, rebuild the search index on next lookup
         self.materials[name] = quantity
         self.save_materials()
 
@@ -71,21 +578,354 @@ class DatabaseManager:
         """Remove a material from the database."""
         if name in self.materials:
             del self.materials[name]
+            self.name_index = None  # Name gone, rebuild the search index on next lookup
             self.save_materials()
 
+    def search_materials(self, prefix, offset=0, limit=50):
+        """Return one page of (name, quantity) pairs whose names start with the prefix."""
+        if self.name_index is None:
+            self.name_index = sorted((name.lower(), name) for name in self.materials)
+        key = prefix.lower()
+        start = bisect.bisect_left(self.name_index, (key,)) + offset  # First match, then skip earlier pages
+        page = []
+        for lowered, name in self.name_index[start:start + limit]:
+            if not lowered.startswith(key):
+                break  # Sorted index, so no later name can match either
+            page.append((name, self.materials[name]))
+        return page
+
+class AuditLog:
+    """Class to keep an append-only, hash-chained record of inventory changes."""
+    GENESIS_HASH = '0' * 64  # Previous hash of the very first entry
+
+    def __init__(self, directory='audit', segment_size=1024 * 1024):
+        self.directory = directory
+        self.segment_size = segment_size  # Start a new segment file once the current one reaches this size
+        self.checkpoint_file = os.path.join(directory, 'checkpoint.json')
+        self.lock_file = os.path.join(directory, 'audit.lock')
+        os.makedirs(directory, exist_ok=True)
+        with file_lock(self.lock_file):
+            self.tail_damaged = self.find_tail()[3]
+
+    def segment_path(self, number):
+        return os.path.join(self.directory, f"audit-{number:06d}.log")
+
+    def segments(self):
+        """Return the numbers of the existing segment files in order."""
+        numbers = []
+        for filename in os.listdir(self.directory):
+            if filename.startswith('audit-') and filename.endswith('.log'):
+                numbers.append(int(filename[6:-4]))
+        return sorted(numbers)
+
+    def parse_line(self, line):
+        """Return (hash, body, entry) for a well-formed line, or None for a damaged one."""
+        try:
+            entry_hash, body = line.decode('utf-8').rstrip('\n').split(' ', 1)
+            entry = json.loads(body)
+            entry['seq'], entry['prev']  # Both are needed to follow the chain
+        except (ValueError, KeyError, TypeError, UnicodeDecodeError):
+            return None
+        return entry_hash, body, entry
+
+    def lines_backwards(self, path, block_size=4096):
+        """Yield the lines of a file from last to first, reading it in blocks from the end."""
+        with open(path, 'rb') as file:
+            file.seek(0, os.SEEK_END)
+            position, rest = file.tell(), b''
+            while position > 0:
+                size = min(block_size, position)
+                position -= size
+                file.seek(position)
+                lines = (file.read(size) + rest).split(b'\n')
+                rest = lines.pop(0)  # May be cut off, the next block completes it
+                yield from reversed(lines)
+            yield rest
+
+    def find_tail(self):
+        """Return the segment to append to, the last sequence number and hash, and whether damaged lines were found."""
+        numbers = self.segments()
+        segment = numbers[-1] if numbers else 0
+        damaged = False
+        for number in reversed(numbers):
+            tail = None
+            lines = self.lines_backwards(self.segment_path(number))
+            if next(lines, b''):
+                damaged = True  # No newline at the end, a write was cut off
+            for line in lines:
+                tail = self.parse_line(line)
+                if tail is not None:
+                    break
+                damaged = True
+            if damaged and number == numbers[-1]:
+                segment = number + 1  # Leave the damaged segment as it is and continue the chain in a new one
+            if tail is not None:
+                entry_hash, body, entry = tail
+                return segment, entry['seq'], entry_hash, damaged
+        return segment, 0, self.GENESIS_HASH, damaged
+
+    def record(self, actor, action, details):
+        """Append one entry chained to the hash of the last entry on disk."""
+        with file_lock(self.lock_file):
+            # Other windows and app copies append to the same chain, so continue from the files, not from memory
+            segment, seq, last_hash = self.find_tail()[:3]
+            path = self.segment_path(segment)
+            if os.path.exists(path) and os.path.getsize(path) >= self.segment_size:
+                path = self.segment_path(segment + 1)  # Continue the chain in a new segment
+            entry = {
+                'seq': seq + 1,
+                'time': datetime.now(tz).isoformat(timespec='seconds'),
+                'actor': actor,
+                'action': action,
+                'details': details,
+                'prev': last_hash,
+            }
+            body = json.dumps(entry, sort_keys=True, separators=(',', ':'))
+            entry_hash = hashlib.sha256(body.encode('utf-8')).hexdigest()
+            with open(path, 'ab') as file:
+                file.write(f"{entry_hash} {body}\n".encode('utf-8'))  # One write per entry survives a crash
+
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_file, 'r', encoding=ENCODING) as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):  # A broken checkpoint means verifying from the start
+            return {'segment': 0, 'offset': 0, 'seq': 0, 'hash': self.GENESIS_HASH}
+
+    def verify(self):
+        """Check the entries written since the last checkpoint and move the checkpoint forward."""
+        with file_lock(self.lock_file):  # An entry being appended would look cut off
+            return self.verify_locked()
+
+    def verify_locked(self):
+        checkpoint = self.load_checkpoint()
+        segment, offset = checkpoint['segment'], checkpoint['offset']
+        seq, last_hash = checkpoint['seq'], checkpoint['hash']
+        if offset and (not os.path.exists(self.segment_path(segment))
+                       or os.path.getsize(self.segment_path(segment)) < offset):
+            return False  # Entries before the checkpoint were truncated
+        for number in self.segments():
+            if number < segment:
+                continue  # Already verified up to the checkpoint
+            with open(self.segment_path(number), 'rb') as file:
+                file.seek(offset if number == segment else 0)
+                for line in file:
+                    parsed = self.parse_line(line)
+                    if parsed is None or not line.endswith(b'\n'):
+                        return False  # Unreadable or cut-off entry
+                    entry_hash, body, entry = parsed
+                    if (entry['prev'] != last_hash or entry['seq'] != seq + 1
+                            or hashlib.sha256(body.encode('utf-8')).hexdigest() != entry_hash):
+                        return False  # Entry was altered, removed or reordered
+                    seq, last_hash = entry['seq'], entry_hash
+                segment, offset = number, file.tell()
+        with open(self.checkpoint_file, 'w', encoding=ENCODING) as file:
+            json.dump({'segment': segment, 'offset': offset, 'seq': seq, 'hash': last_hash}, file)
+        return True
+
+class Lab:
+    """Class to represent one laboratory with its own inventory, log, history and audit files."""
+    def __init__(self, name, directory):
+        self.name = name
+        self.directory = directory
+        self.database_file = os.path.join(directory, 'database.txt')
+        self.log_file = os.path.join(directory, 'log.csv')
+
+    def open_database(self):
+        """Load this lab's inventory, only when a window actually needs it."""
+        return DatabaseManager(self.database_file, history=InventoryHistory(os.path.join(self.directory, 'history')))
+
+    def open_audit_log(self):
+        return AuditLog(os.path.join(self.directory, 'audit'))
+
+def find_in_lab(database_file, prefix):
+    """Return the (name, quantity) pairs in one lab whose names start with the prefix."""
+    # Runs in a worker process, so it only reads: a DatabaseManager would also clean up after the GUI's saves
+    key = prefix.lower()
+    materials = read_materials(database_file, [])
+    return sorted(((name, quantity) for name, quantity in materials.items() if name.lower().startswith(key)),
+                  key=lambda pair: (pair[0].lower(), pair[0]))
+
+class LabRegistry:
+    """Class to find the labs and share one account index between them."""
+    MAIN_LAB = 'Main'  # Lab kept in the working directory, as before labs existed
+
+    def __init__(self, root='labs', accounts_file='accounts.txt', max_workers=None):
+        self.root = root  # Every other lab is a folder in here
+        self.accounts = AccountManager(accounts_file)  # Students register once and can borrow from any lab
+        self.max_workers = max_workers
+        self.pool = None  # Worker processes, started by the first cross-lab query and reused after that
+
+    def names(self):
+        """Return the names of all labs, the main lab first."""
+        try:
+            # A folder named like the main lab would be a second lab with the same name, so it is skipped
+            folders = sorted(entry.name for entry in os.scandir(self.root)
+                             if entry.is_dir() and entry.name != self.MAIN_LAB)
+        except FileNotFoundError:
+            folders = []
+        return [self.MAIN_LAB] + folders
+
+    def get(self, name):
+        """Return the lab with the given name, without loading any of its files."""
+        if name == self.MAIN_LAB:
+            return Lab(name, '.')
+        return Lab(name, os.path.join(self.root, name))
+
+    def query_all(self, function, *args):
+        """Run function(database_file, *args) for every lab in parallel worker processes and wait for them."""
+        names = self.names()
+        if self.pool is None:
+            # Spawned rather than forked, so the workers do not inherit the Qt state of the GUI process
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        futures = [self.pool.submit(function, self.get(name).database_file, *args) for name in names]
+        return {name: future.result() for name, future in zip(names, futures)}
+
+    def shutdown(self):
+        """Stop the worker processes, if any were started."""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+lab_registry = LabRegistry()  # Shared by every window
+
+class LabQueryThread(QtCore.QThread):
+    """Thread that runs a cross-lab query so the window stays responsive while it waits."""
+    results_ready = QtCore.pyqtSignal(object)  # Results keyed by lab name
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, function, *args, parent=None):
+        super().__init__(parent)
+        self.function = function
+        self.args = args
+
+    def run(self):
+        try:
+            results = lab_registry.query_all(self.function, *self.args)
+        except Exception as error:  # Report any failure of a worker back to the window
+            self.failed.emit(str(error))
+        else:
+            self.results_ready.emit(results)
+
+class LazyComboBox(QtWidgets.QComboBox):
+    """Editable combo box that loads its options page by page from a data source callback."""
+    def __init__(self, source, page_size=50, max_items=500, debounce_ms=200, parent=None):
+        super().__init__(parent)
+        self.source = source  # Called as source(prefix, offset, limit), returns (name, data) pairs
+        self.page_size = page_size
+        self.max_items = max(max_items, 2 * page_size)  # Loaded options at most, keeps memory flat
+        self.prefix = ""
+        self.first_offset = 0  # Source offset of the first loaded option
+        self.exhausted = False  # True once the source has no more options for the prefix
+        self.scrolling = False  # Set while the window moves, so its own scrolling is ignored
+        self.setEditable(True)  # Allow searching
+        self.setInsertPolicy(QtWidgets.QComboBox.NoInsert)  # Typed text is a filter, not a new option
+        self.setCompleter(None)  # Filtering is done by the source, not over the loaded page
+
+        # Restart the timer on every keystroke so the source is only queried once typing pauses
+        self.filter_timer = QtCore.QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(debounce_ms)
+        self.filter_timer.timeout.connect(self.apply_filter)
+        self.lineEdit().textEdited.connect(lambda text: self.filter_timer.start())
+
+        # Move the loaded window when the dropdown is scrolled to either end
+        self.view().verticalScrollBar().valueChanged.connect(self.on_scroll)
+
+        self.reload()
+
+    @metrics.timed('combo_reload')
+    def reload(self, prefix=""):
+        """Drop the loaded options and fetch the first page for the prefix."""
+        self.prefix = prefix
+        self.first_offset = 0
+        self.exhausted = False
+        self.clear()
+        self.load_page()
+
+    @metrics.timed('combo_load_page')
+    def load_page(self):
+        """Append the next page of options, dropping pages from the front once max_items are loaded."""
+        if self.exhausted:
+            return
+        rows = self.source(self.prefix, self.first_offset + self.count(), self.page_size)
+        for name, data in rows:
+            self.addItem(name, data)  # Show the name, keep the data (e.g. availability) as item data
+        if len(rows) < self.page_size:
+            self.exhausted = True
+        extra = self.count() - self.max_items
+        if extra > 0:
+            self.drop_rows(0, extra)
+            self.first_offset += extra
+
+    @metrics.timed('combo_load_page')
+    def load_previous_page(self):
+        """Insert the page before the first loaded option, dropping pages from the back once max_items are loaded."""
+        if self.first_offset == 0:
+            return
+        start = max(0, self.first_offset - self.page_size)
+        rows = self.source(self.prefix, start, self.first_offset - start)
+        for row, (name, data) in enumerate(rows):
+            self.insertItem(row, name, data)
+        self.first_offset = start
+        extra = self.count() - self.max_items
+        if extra > 0:
+            self.drop_rows(self.count() - extra, extra)
+            self.exhausted = False  # The dropped options can be fetched again
+
+    def drop_rows(self, first, count):
+        """Remove loaded options without touching the typed text or the selection signals."""
+        text = self.lineEdit().text()
+        self.blockSignals(True)
+        self.model().removeRows(first, count)
+        self.setEditText(text)
+        self.blockSignals(False)
+
+    def apply_filter(self):
+        """Reload the options for the typed text without losing what the user typed."""
+        text = self.lineEdit().text()
+        cursor = self.lineEdit().cursorPosition()
+        self.reload(text.strip())
+        self.setEditText(text)  # Adding items replaces the edit text, so put it back
+        self.lineEdit().setCursorPosition(cursor)
+
+    def on_scroll(self, value):
+        if self.scrolling:
+            return
+        scroll_bar = self.view().verticalScrollBar()
+        self.scrolling = True
+        try:
+            # Keep the option at the edge in view, its row changes when pages are dropped or inserted
+            if value == scroll_bar.maximum() and not self.exhausted:
+                anchor = self.first_offset + self.count() - 1
+                self.load_page()
+                hint = QtWidgets.QAbstractItemView.PositionAtBottom
+            elif value == scroll_bar.minimum() and self.first_offset > 0:
+                anchor = self.first_offset
+                self.load_previous_page()
+                hint = QtWidgets.QAbstractItemView.PositionAtTop
+            else:
+                return
+            self.view().scrollTo(self.model().index(anchor - self.first_offset, 0), hint)
+        finally:
+            self.scrolling = False
+
 class BorrowingApp(QtWidgets.QWidget):
     """Main application for borrowing laboratory materials."""
-    def __init__(self, student_name, student_number):
+    def __init__(self, student_name, student_number, lab=None):
         super().__init__()
         self.student_name = student_name
         self.student_number = student_number
-        self.materials = []  # List to hold borrowed materials
-        self.db_manager = DatabaseManager()  # Initialize database manager
+        self.lab = lab or lab_registry.get(LabRegistry.MAIN_LAB)  # Lab to borrow from
+        self.cart = BorrowingCart()  # Materials to borrow in this session
+        self.db_manager = self.lab.open_database()  # Initialize database manager
+        self.audit_log = self.lab.open_audit_log()  # Record every change to the stock
         self.init_ui()  # Initialize the user interface
 
     def init_ui(self):
         """Set up the user interface for borrowing materials."""
-        self.setWindowTitle('Laboratory Materials Borrowing')
+        self.setWindowTitle(f'Laboratory Materials Borrowing - {self.lab.name}')
         self.setFixedSize(1910, 980)
 
         self.layout = QtWidgets.QVBoxLayout()
@@ -117,12 +957,8 @@ class BorrowingApp(QtWidgets.QWidget):
         self.material_label.setFont(QtGui.QFont("Helvetica", 16))  # Set font size
         self.layout.addWidget(self.material_label)
 
-        # Dropdown for materials
-        self.material_combo = QtWidgets.QComboBox(self)
-        self.material_combo.setEditable(True)  # Allow searching
-        for material_name, quantity in self.db_manager.materials.items():
-            self.material_combo.addItem(material_name)  # Only show the name
-            self.material_combo.setItemData(self.material_combo.count() - 1, quantity)  # Set availability as data
+        # Dropdown for materials, filled page by page with availability as item data
+        self.material_combo = LazyComboBox(self.available_materials, parent=self)
         self.material_combo.setFixedHeight(50)  # Set a fixed height
         self.material_combo.setFont(QtGui.QFont("Helvetica", 16))  # Set font size
         self.layout.addWidget(self.material_combo)
@@ -180,9 +1016,14 @@ class BorrowingApp(QtWidgets.QWidget):
         available_quantity = self.material_combo.itemData(current_index)  # Get the available quantity
         self.available_label.setText(f"Available: {available_quantity}")  # Update the label text
 
+    def available_materials(self, prefix, offset, limit):
+        """Return one page of materials with the quantities still free after the cart."""
+        return [(name, quantity - self.cart.reserved(name))
+                for name, quantity in self.db_manager.search_materials(prefix, offset, limit)]
+
     def add_material(self):
         """Add a material to the borrowing list."""
-        if len(self.materials) >= 12:
+        if len(self.cart.materials) >= 12:
             QtWidgets.QMessageBox.warning(self, "Limit Reached",
                                           "You can only borrow up to 12 different types of materials.")
             return
@@ -192,24 +1033,18 @@ class BorrowingApp(QtWidgets.QWidget):
 
         # If the material name is valid, add it to the list
         if material_name and material_name in self.db_manager.materials:
-            available_quantity = self.db_manager.materials[material_name]
+            available_quantity = self.db_manager.materials[material_name] - self.cart.reserved(material_name)
             if quantity > available_quantity:
                 QtWidgets.QMessageBox.warning(self, "Quantity Error",
                                               f"Only {available_quantity} available for {material_name}.")
                 return
 
-            # Append material to the list
-            self.materials.append(Material(material_name, quantity))
+            # Append material to the cart, which lowers its availability until checkout
+            self.cart.add(material_name, quantity)
             self.materials_list.addItem(f"{material_name}: {quantity}")  # Update the displayed list
 
-            # Update the database or the source of materials
-            self.db_manager.materials[material_name] -= quantity  # Decrease available quantity
-
             # Refresh the ComboBox
-            self.material_combo.clear()  # Clear the dropdown for new input
-            for name, qty in self.db_manager.materials.items():
-                self.material_combo.addItem(name)  # Add material name
-                self.material_combo.setItemData(self.material_combo.count() - 1, qty)  # Set available quantity as data
+            self.material_combo.reload()  # Reload the first page with the new availability
 
             # Reset the available quantity label
             self.update_available_quantity()  # Update the label to reflect the current selected material's availability
@@ -221,18 +1056,16 @@ class BorrowingApp(QtWidgets.QWidget):
         selected_item = self.materials_list.currentItem()  # Get the selected item
         if selected_item:
             material_name = selected_item.text().split(':')[0]  # Extract material name
-            # Find the material in the materials list and remove it
-            for material in self.materials:
-                if material.name == material_name:
-                    self.materials.remove(material)  # Remove material from the list
-                    break
+            self.cart.remove(material_name)  # Remove material from the cart
             self.materials_list.takeItem(self.materials_list.row(selected_item))  # Remove from the displayed list
+            self.material_combo.reload()  # Show the returned quantity as available again
+            self.update_available_quantity()
         else:
             QtWidgets.QMessageBox.warning(self, "Selection Error", "Please select a material to remove.")
 
     def finish_borrowing(self):
         """Finalize the borrowing process and log the information."""
-        if not self.materials:
+        if not self.cart.materials:
             QtWidgets.QMessageBox.warning(self, "Input Error", "Please add at least one material.")
             return
 
@@ -242,43 +1075,33 @@ class BorrowingApp(QtWidgets.QWidget):
 
         # Prepare borrowing information for display
         borrowing_info = f"Borrowing Information:\nDate and Time: {current_time}\nBorrower: {self.student_name} ({self.student_number})\nMaterials Borrowed:\n"
-        for material in self.materials:
+        borrowed = {}
+        for material in self.cart.materials:
             borrowing_info += f"- {material.name}: {material.quantity}\n"
+            borrowed[material.name] = borrowed.get(material.name, 0) + material.quantity
+
+        # Log the borrowing and update the stock in one step, once per cart
+        try:
+            committed = self.cart.commit(self.db_manager, self.lab.log_file, self.student_name,
+                                         self.student_number, current_time)
+        except Exception as error:  # checkout() undoes its writes on any error
+            QtWidgets.QMessageBox.warning(self, "Borrowing Error",
+                                          f"Could not save the borrowing, nothing was changed: {error}")
+            return
+        if not committed:
+            return  # This cart was already checked out
+        self.audit_log.record(f"{self.student_name} ({self.student_number})", 'borrow',
+                              {'key': self.cart.key, 'materials': borrowed})
 
         # Show the borrowing information in a message box
         QtWidgets.QMessageBox.information(self, "Borrowing Information", borrowing_info)
-        self.log_borrowing(current_time)  # Log the borrowing details
-        self.update_database()  # Update the database with borrowed quantities
         self.clear_inputs()  # Clear inputs for the next borrowing session.
 
-    def log_borrowing(self, current_time):
-        """Log the borrowing information to a CSV file, including the borrower's name."""
-        with open('log.csv', 'a', newline='') as log_file:
-            log_writer = csv.writer(log_file)
-
-            # Write the header only if the file is empty
-            if log_file.tell() == 0:
-                log_writer.writerow(['Borrower', 'Student Number', 'Date', 'Materials'])  # Write header
-
-            # Write the borrowing details to the log file
-            materials_borrowed = "; ".join([f"{material.name}:{material.quantity}" for material in self.materials])
-            log_writer.writerow([self.student_name, self.student_number, current_time, materials_borrowed])
-
-    def update_database(self):
-        """Update the database to reflect the quantities of borrowed materials."""
-        for material in self.materials:
-            if material.name in self.db_manager.materials:
-                self.db_manager.materials[material.name] -= material.quantity  # Subtract borrowed quantity
-                if self.db_manager.materials[material.name] < 0:
-                    self.db_manager.materials[material.name] = 0  # Prevent negative stock
-        self.db_manager.save_materials()  # Save updated materials to the database file
-
     def clear_inputs(self):
         """Clear the input fields and materials list for a new borrowing session."""
-        self.materials.clear()  # Clear the materials list
+        self.cart.clear()  # Empty the cart and get a new checkout key
         self.materials_list.clear()  # Clear the displayed materials
-        self.material_combo.clear()  # Clear the material dropdown
-        self.material_combo.addItems(self.db_manager.materials.keys())  # Refresh dropdown items
+        self.material_combo.reload()  # Refresh dropdown items
         self.quantity_input.setValue(1)  # Reset quantity to default
 
     def go_back(self):
@@ -288,14 +1111,17 @@ class BorrowingApp(QtWidgets.QWidget):
 
 class AdminApp(QtWidgets.QWidget):
     """ Admin application for managing materials."""
-    def __init__(self):
+    def __init__(self, lab=None):
         super().__init__()
-        self.db_manager = DatabaseManager()  # Initialize database manager
+        self.lab = lab or lab_registry.get(LabRegistry.MAIN_LAB)  # Lab to manage
+        self.db_manager = self.lab.open_database()  # Initialize database manager
+        self.audit_log = self.lab.open_audit_log()  # Record every change to the stock
         self.init_ui()  # Initialize the user interface
+        self.report_load_errors()  # Tell the admin about lines that were skipped
 
     def init_ui(self):
         """Set up the user interface for the admin application."""
-        self.setWindowTitle('Admin Materials Management')
+        self.setWindowTitle(f'Admin Materials Management - {self.lab.name}')
         self.setFixedSize(1910, 980)
 
         self.layout = QtWidgets.QVBoxLayout()
@@ -342,11 +1168,71 @@ class AdminApp(QtWidgets.QWidget):
         self.remove_button.clicked.connect(self.remove_material)  # Connect button to remove_material method
         self.layout.addWidget(self.remove_button)
 
+        # Button to verify the audit log
+        self.verify_button = QtWidgets.QPushButton("Verify Audit Log")
+        self.verify_button.setFixedHeight(50)  # Set a fixed height
+        self.verify_button.setFont(QtGui.QFont("Helvetica", 16))  # Set font size
+        self.verify_button.clicked.connect(self.verify_audit_log)  # Connect button to verify_audit_log method
+        self.layout.addWidget(self.verify_button)
+
+        # Date and time to look up past stock
+        self.history_input = QtWidgets.QDateTimeEdit(QtCore.QDateTime.currentDateTime(), self)
+        self.history_input.setDisplayFormat("yyyy-MM-dd HH:mm")
+        self.history_input.setCalendarPopup(True)
+        self.history_input.setFixedHeight(50)  # Set a fixed height
+        self.history_input.setFont(QtGui.QFont("Helvetica", 16))  # Set font size
+        self.layout.addWidget(self.history_input)
+
+        # Button to show the stock of a material at the chosen date and time
+        self.history_button = QtWidgets.QPushButton("Show Stock At Date")
+        self.history_button.setFixedHeight(50)  # Set a fixed height
+        self.history_button.setFont(QtGui.QFont("Helvetica", 16))  # Set font size
+        self.history_button.clicked.connect(self.show_stock_at)  # Connect button to show_stock_at method
+        self.layout.addWidget(self.history_button)
+
+        # Button to search the typed name in every lab
+        self.search_labs_button = QtWidgets.QPushButton("Search All Labs")
+        self.search_labs_button.setFixedHeight(50)  # Set a fixed height
+        self.search_labs_button.setFont(QtGui.QFont("Helvetica", 16))  # Set font size
+        self.search_labs_button.clicked.connect(self.search_all_labs)  # Connect button to search_all_labs method
+        self.layout.addWidget(self.search_labs_button)
+
         # List widget to display materials
         self.materials_list = QtWidgets.QListWidget(self)
         self.update_materials_list()  # Populate the list with current materials
         self.layout.addWidget(self.materials_list)
 
+        # Diagnostics panel with live metrics
+        diagnostics_box = QtWidgets.QGroupBox("Diagnostics", self)
+        diagnostics_box.setFont(QtGui.QFont("Helvetica", 12))
+        diagnostics_layout = QtWidgets.QVBoxLayout(diagnostics_box)
+        controls_layout = QtWidgets.QHBoxLayout()
+
+        self.metrics_checkbox = QtWidgets.QCheckBox("Enable metrics")
+        self.metrics_checkbox.setChecked(metrics.enabled)
+        self.metrics_checkbox.toggled.connect(self.toggle_metrics)  # Switch timing on or off at runtime
+        controls_layout.addWidget(self.metrics_checkbox)
+
+        self.export_button = QtWidgets.QPushButton("Export Metrics")
+        self.export_button.clicked.connect(self.export_metrics)  # Connect button to export_metrics method
+        controls_layout.addWidget(self.export_button)
+
+        self.profile_button = QtWidgets.QPushButton("Start Profiling")
+        self.profile_button.clicked.connect(self.toggle_profiling)  # Connect button to toggle_profiling method
+        controls_layout.addWidget(self.profile_button)
+        diagnostics_layout.addLayout(controls_layout)
+
+        self.metrics_view = QtWidgets.QPlainTextEdit(diagnostics_box)
+        self.metrics_view.setReadOnly(True)
+        self.metrics_view.setFixedHeight(120)  # Set a fixed height
+        diagnostics_layout.addWidget(self.metrics_view)
+        self.layout.addWidget(diagnostics_box)
+
+        # Refresh the metrics view once a second
+        self.metrics_timer = QtCore.QTimer(self)
+        self.metrics_timer.timeout.connect(self.refresh_metrics)
+        self.metrics_timer.start(1000)
+
         # Adding the back button
         self.back_button = QtWidgets.QPushButton("Back")
         self.back_button.setFixedHeight(50)  # Set a fixed height
@@ -360,7 +1246,10 @@ class AdminApp(QtWidgets.QWidget):
         quantity = self.quantity_input.value()  # Get material quantity input
 
         if material_name:
+            old_quantity = self.db_manager.materials.get(material_name)  # None for a new material
             self.db_manager.add_material(material_name, quantity)  # Add or update material in the database
+            self.audit_log.record("Admin", 'add' if old_quantity is None else 'update',
+                                  {'name': material_name, 'old': old_quantity, 'new': quantity})
             self.update_materials_list()  # Refresh the materials list
             self.material_name_input.clear()  # Clear the input field
             self.quantity_input.setValue(1)  # Reset quantity to default
@@ -370,15 +1259,115 @@ class AdminApp(QtWidgets.QWidget):
         selected_item = self.materials_list.currentItem()  # Get the selected item
         if selected_item:
             material_name = selected_item.text().split(':')[0]  # Extract material name
+            old_quantity = self.db_manager.materials.get(material_name)
             self.db_manager.remove_material(material_name)  # Remove material from the database
+            self.audit_log.record("Admin", 'remove', {'name': material_name, 'old': old_quantity})
             self.update_materials_list()  # Refresh the materials list
 
+    @metrics.timed('admin_list_refresh')
     def update_materials_list(self):
         """Update the displayed list of materials."""
         self.materials_list.clear()  # Clear the current list
         for name, quantity in self.db_manager.materials.items():
             self.materials_list.addItem(f"{name}: {quantity}")  # Add materials to the list
 
+    def report_load_errors(self):
+        """Warn about database lines and audit log entries that could not be read."""
+        if self.audit_log.tail_damaged:
+            QtWidgets.QMessageBox.warning(self, "Audit Log",
+                                          "The end of the audit log is damaged, new entries go to a new segment.")
+        errors = self.db_manager.load_errors
+        if errors:
+            details = "\n".join(f"Line {number}: {reason}" for number, line, reason in errors[:10])
+            if len(errors) > 10:
+                details += f"\n... and {len(errors) - 10} more"
+            QtWidgets.QMessageBox.warning(self, "Database Warning",
+                                          f"{len(errors)} line(s) in {self.db_manager.filename} could not be read. "
+                                          f"They are left in the file unchanged:\n{details}")
+
+    def search_all_labs(self):
+        """Show the stock of materials starting with the typed name in every lab."""
+        prefix = self.material_name_input.text().strip()  # Blank lists everything
+        self.search_labs_button.setEnabled(False)  # One search at a time
+        self.search_labs_button.setText("Searching All Labs...")
+        self.query_thread = LabQueryThread(find_in_lab, prefix, parent=self)  # Each lab is read in its own process
+        self.query_thread.results_ready.connect(self.show_lab_results)
+        self.query_thread.failed.connect(self.show_lab_error)
+        self.query_thread.finished.connect(self.search_finished)
+        self.query_thread.start()
+
+    def search_finished(self):
+        self.search_labs_button.setEnabled(True)
+        self.search_labs_button.setText("Search All Labs")
+
+    def show_lab_error(self, message):
+        QtWidgets.QMessageBox.warning(self, "All Labs", f"Search failed: {message}")
+
+    def show_lab_results(self, results):
+        """Show the stock found in every lab."""
+        lines = []
+        for lab_name, found in results.items():
+            for name, quantity in found[:20]:
+                lines.append(f"{lab_name} - {name}: {quantity}")
+            if len(found) > 20:
+                lines.append(f"{lab_name} - ... and {len(found) - 20} more")
+        QtWidgets.QMessageBox.information(self, "All Labs", "\n".join(lines) or "No matching materials in any lab.")
+
+    def show_stock_at(self):
+        """Show the stock of the typed material at the chosen date and time."""
+        material_name = self.material_name_input.text().strip()  # Get material name input
+        if not material_name:
+            QtWidgets.QMessageBox.warning(self, "Input Error", "Please enter a material name.")
+            return
+        when = self.history_input.dateTime().toSecsSinceEpoch()
+        stock = self.db_manager.history.state_at(when)  # Rebuild the stock at that moment
+        label = self.history_input.dateTime().toString("yyyy-MM-dd HH:mm")
+        if material_name in stock:
+            QtWidgets.QMessageBox.information(self, "Stock History",
+                                              f"{material_name} at {label}: {stock[material_name]}")
+        else:
+            QtWidgets.QMessageBox.information(self, "Stock History", f"No record of {material_name} at {label}.")
+
+    def toggle_metrics(self, checked):
+        """Turn metric collection on or off."""
+        metrics.enabled = checked
+        self.refresh_metrics()
+
+    def refresh_metrics(self):
+        """Show the latest metrics in the diagnostics panel."""
+        if not metrics.enabled:
+            self.metrics_view.setPlainText("Metrics are disabled.")
+        else:
+            self.metrics_view.setPlainText(metrics.summary() or "No operations timed yet.")
+
+    def export_metrics(self):
+        """Write the metrics to metrics.json and metrics.prom."""
+        metrics.export_json()
+        metrics.export_prometheus()
+        QtWidgets.QMessageBox.information(self, "Metrics", "Metrics saved to metrics.json and metrics.prom.")
+
+    def toggle_profiling(self):
+        """Start a cProfile capture, or stop it and save it to profile.prof."""
+        if metrics.profiler is None:
+            metrics.start_profile()
+            self.profile_button.setText("Stop Profiling")
+        else:
+            metrics.stop_profile()
+            self.profile_button.setText("Start Profiling")
+            QtWidgets.QMessageBox.information(self, "Profiling", "Profile saved to profile.prof.")
+
+    def verify_audit_log(self):
+        """Check the audit log for tampering since the last verification."""
+        if self.audit_log.verify():
+            QtWidgets.QMessageBox.information(self, "Audit Log", "Audit log is intact.")
+        else:
+            QtWidgets.QMessageBox.warning(self, "Audit Log", "Audit log has been modified or is incomplete.")
+
+    def closeEvent(self, event):
+        """Stop refreshing the diagnostics once the window is closed."""
+        self.metrics_timer.stop()  # A closed window is only hidden, the timer would keep running
+        super().closeEvent(event)
+
     def go_back(self):
         self.close()
         self.login_window = LoginWindow()
@@ -388,7 +1377,7 @@ class LoginWindow(QtWidgets.QWidget):
     """Login window for entering student information."""
     def __init__(self):
         super().__init__()
-        self.account_manager = AccountManager()  # Initialize account manager
+        self.account_manager = lab_registry.accounts  # Account index shared by all labs
         self.init_ui()  # Initialize the user interface
 
     def init_ui(self):
@@ -440,6 +1429,13 @@ class LoginWindow(QtWidgets.QWidget):
         self.number_input.setFont(font)  # Use the same font size
         self.layout.addWidget(self.number_input)
 
+        # Dropdown for the lab to open
+        self.lab_combo = QtWidgets.QComboBox(self)
+        self.lab_combo.addItems(lab_registry.names())
+        self.lab_combo.setFixedHeight(50)  # Set a fixed height
+        self.lab_combo.setFont(font)  # Use the same font size
+        self.layout.addWidget(self.lab_combo)
+
         # Button to log in
         self.login_button = QtWidgets.QPushButton("Login")
         self.login_button.setFixedHeight(50)  # Set a fixed height
@@ -492,16 +1488,19 @@ class LoginWindow(QtWidgets.QWidget):
 
     def open_borrowing_app(self, student_name, student_number):
         """Open the borrowing application with the provided student information."""
-        self.borrowing_app = BorrowingApp(student_name, student_number)
+        lab = lab_registry.get(self.lab_combo.currentText())  # Lab chosen in the dropdown
+        self.borrowing_app = BorrowingApp(student_name, student_number, lab)
         self.borrowing_app.show()
 
     def open_admin_app(self):
         """Open the admin application."""
-        self.admin_app = AdminApp()
+        self.admin_app = AdminApp(lab_registry.get(self.lab_combo.currentText()))
         self.admin_app.show()
 
 if __name__ == '__main__':
     app = QtWidgets.QApplication(sys.argv)
     login_window = LoginWindow()  # Create the login window
     login_window.show()  # Show the login window
-    sys.exit(app.exec_())  # Start the application event loop
\ No newline at end of file
+    exit_code = app.exec_()  # Start the application event loop
+    lab_registry.shutdown()  # Stop any cross-lab query workers
+    sys.exit(exit_code)
\ No newline at end of file